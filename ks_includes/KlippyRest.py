@@ -1,14 +1,23 @@
 import logging
 import re
 import requests
+from requests.adapters import HTTPAdapter
 
 
 class KlippyRest:
-    def __init__(self, ip, port=7125, api_key=False):
+    def __init__(self, ip, port=7125, api_key=False, session=None):
         self.ip = ip
         self.port = port
         self.api_key = api_key
         self.status = ''
+        # Cleared if the batch endpoint is missing, older moonraker versions don't have it
+        self.batch_supported = True
+        self.http_error = None
+        # Keep-alive connections to moonraker, avoids a handshake per request
+        self.session = session or requests.Session()
+        # The session outlives reconnects, mounting again would leak the previous pool
+        if f"{self.endpoint}/" not in self.session.adapters:
+            self.session.mount(f"{self.endpoint}/", HTTPAdapter(pool_connections=4, pool_maxsize=8))
 
     @property
     def endpoint(self):
@@ -33,11 +42,40 @@ class KlippyRest:
         return self.send_request(f"server/files/gcodes/{thumbnail}", json=False)
 
     def send_request(self, method, json=True):
-        url = f"{self.endpoint}/{method}"
+        return self._request("get", f"{self.endpoint}/{method}", json=json)
+
+    def send_batch(self, calls):
+        # Sends a list of (method, params) as one JSON-RPC batch
+        # Returns a response per call (False if that call failed) or False if the batch failed
+        if not self.batch_supported:
+            return False
+        batch = [
+            {"jsonrpc": "2.0", "method": method, "params": params or {}, "id": i}
+            for i, (method, params) in enumerate(calls)
+        ]
+        data = self._request("post", f"{self.endpoint}/server/jsonrpc", payload=batch)
+        if not isinstance(data, list):
+            # Only a missing endpoint disables batching, other errors may be transient
+            if self.http_error in {404, 405}:
+                logging.info("JSON-RPC batch not supported, using individual requests from now on")
+                self.batch_supported = False
+            return False
+        responses = {response.get('id'): response for response in data if isinstance(response, dict)}
+        results = []
+        for i, (method, params) in enumerate(calls):
+            if i in responses and 'result' in responses[i]:
+                results.append({"result": responses[i]['result']})
+            else:
+                logging.error(f"{method} failed: {responses.get(i, {}).get('error')}")
+                results.append(False)
+        return results
+
+    def _request(self, verb, url, json=True, payload=None):
         headers = {} if self.api_key is False else {"x-api-key": self.api_key}
         data = False
+        self.http_error = None
         try:
-            response = requests.get(url, headers=headers, timeout=3)
+            response = self.session.request(verb, url, headers=headers, json=payload, timeout=3)
             response.raise_for_status()
             if json:
                 logging.debug(f"Sending request to {url}")
@@ -46,6 +84,7 @@ class KlippyRest:
                 data = response.content
         except requests.exceptions.HTTPError as h:
             self.status = self.format_status(h)
+            self.http_error = h.response.status_code if h.response is not None else None
         except requests.exceptions.ConnectionError as c:
             self.status = self.format_status(c)
         except requests.exceptions.Timeout as t:
@@ -1,8 +1,10 @@
 #!/usr/bin/python
 
+import contextlib
 import threading
 import json
 import logging
+from queue import Empty, Full, Queue, SimpleQueue
 
 import gi
 import websocket
@@ -19,6 +21,10 @@ class KlippyWebsocket(threading.Thread):
     callback_table = {}
     reconnect_count = 0
     max_retries = 4
+    # Messages handled per main loop iteration, so redraws and input aren't starved
+    max_dispatch = 20
+    # Pending outgoing messages, the oldest is dropped if the socket stalls
+    max_outbox = 100
 
     def __init__(self, screen, callback, host, port):
         threading.Thread.__init__(self)
@@ -31,6 +37,10 @@ class KlippyWebsocket(threading.Thread):
         self.closing = False
         self.host = host
         self.port = port
+        self._messages = SimpleQueue()
+        self._dispatch_lock = threading.Lock()
+        self._dispatch_scheduled = False
+        self._outbox = None
 
     @property
     def _url(self):
@@ -111,15 +121,39 @@ class KlippyWebsocket(threading.Thread):
                     self.callback_table[response['id']][1],
                     self.callback_table[response['id']][2],
                     *self.callback_table[response['id']][3])
-            GLib.idle_add(self.callback_table[response['id']][0], *args)
+            self._queue_message(self.callback_table[response['id']][0], args)
             self.callback_table.pop(response['id'])
             return
 
         if "method" in response and "on_message" in self._callback:
             args = response['method'], response['params'][0] if "params" in response else {}
-            GLib.idle_add(self._callback['on_message'], *args)
+            self._queue_message(self._callback['on_message'], args)
         return
 
+    def _queue_message(self, callback, args):
+        # Runs in the websocket thread, the main loop is woken up only if it isn't already draining the queue
+        self._messages.put((callback, args))
+        with self._dispatch_lock:
+            if not self._dispatch_scheduled:
+                self._dispatch_scheduled = True
+                GLib.idle_add(self._dispatch_messages)
+
+    def _dispatch_messages(self):
+        for _ in range(self.max_dispatch):
+            try:
+                callback, args = self._messages.get_nowait()
+            except Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                logging.exception(f"Error processing websocket message:\n{e}")
+        with self._dispatch_lock:
+            if self._messages.empty():
+                self._dispatch_scheduled = False
+                return False
+        return True
+
     def send_method(self, method, params=None, callback=None, *args):
         if not self.connected:
             return False
@@ -136,11 +170,40 @@ class KlippyWebsocket(threading.Thread):
             "params": params,
             "id": self._req_id
         }
-        self.ws.send(json.dumps(data))
+        self._queue_send((self._req_id, json.dumps(data)))
         return True
 
+    def _queue_send(self, message):
+        # The writer thread does the actual send, so a full socket buffer can't block the UI
+        try:
+            self._outbox.put_nowait(message)
+        except Full:
+            with contextlib.suppress(Empty):
+                dropped = self._outbox.get_nowait()
+                logging.error("Websocket send queue is full, dropping the oldest message")
+                if dropped is not None:
+                    self.callback_table.pop(dropped[0], None)
+            with contextlib.suppress(Full):
+                self._outbox.put_nowait(message)
+
+    @staticmethod
+    def _send_loop(ws, outbox):
+        # Bound to the connection it was started for, queued messages never go out on a newer one
+        while True:
+            message = outbox.get()
+            if message is None:
+                logging.debug("Stopping websocket writer")
+                return
+            try:
+                ws.send(message[1])
+            except Exception as e:
+                logging.error(f"Unable to send to moonraker: {e}")
+
     def on_open(self, *args):
         logging.info("Moonraker Websocket Open")
+        ws = args[0] if args else self.ws
+        self._outbox = Queue(maxsize=self.max_outbox)
+        threading.Thread(target=self._send_loop, args=(ws, self._outbox), daemon=True).start()
         self.connected = True
         self.connecting = False
         self._screen.reinit_count = 0
@@ -157,6 +220,8 @@ class KlippyWebsocket(threading.Thread):
         if not self.connected:
             logging.debug("Connection already closed")
             return
+        # Stop the writer of this connection
+        self._queue_send(None)
         if self.closing:
             logging.debug("Closing websocket")
             self.ws.keep_running = False
@@ -44,6 +44,7 @@ class KlipperScreenConfig:
         self.defined_config = None
         self.lang = None
         self.langs = {}
+        self.bool_cache = {}
 
         try:
             self.config.read(self.default_config_path)
@@ -121,8 +122,10 @@ class KlipperScreenConfig:
 
     def install_language(self, lang):
         if lang is None or lang == "system_lang":
+            # getlocale() returns None when the locale is not set
+            system_lang = locale.getlocale()[0] or ""
             for language in self.lang_list:
-                if locale.getlocale()[0].startswith(language):
+                if system_lang.startswith(language):
                     logging.debug("Using system lang")
                     lang = language
         if lang is not None and lang not in self.lang_list:
@@ -413,6 +416,12 @@ class KlipperScreenConfig:
     def get_main_config(self):
         return self.config['main']
 
+    def get_main_bool(self, name, fallback):
+        # Parsed once, the cache is cleared on set()
+        if name not in self.bool_cache:
+            self.bool_cache[name] = self.config['main'].getboolean(name, fallback)
+        return self.bool_cache[name]
+
     def get_menu_items(self, menu="__main", subsection=""):
         if subsection != "":
             subsection = f"{subsection} "
@@ -514,6 +523,7 @@ class KlipperScreenConfig:
 
     def set(self, section, name, value):
         self.config.set(section, name, value)
+        self.bool_cache.clear()
 
     def log_config(self, config):
         lines = [
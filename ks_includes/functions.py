@@ -1,3 +1,4 @@
+import functools
 import logging
 import logging.handlers
 import os
@@ -8,10 +9,20 @@ import threading
 import time
 import traceback
 from queue import SimpleQueue as Queue
+from jinja2 import Environment
 
 import ctypes
 import struct
 
+# Shared by every render, the translations are installed again when the language changes
+JINJA_ENV = Environment(extensions=["jinja2.ext.i18n"], autoescape=True)
+
+
+@functools.lru_cache(maxsize=128)
+def compile_template(text):
+    return JINJA_ENV.from_string(text)
+
+
 dpms_loaded = False
 try:
     ctypes.cdll.LoadLibrary('libXext.so.6')
@@ -1,18 +1,36 @@
 import logging
 import contextlib
 import gi
+from enum import IntEnum
 
 gi.require_version("Gtk", "3.0")
 from gi.repository import GLib
 
 
+class PrinterState(IntEnum):
+    DISCONNECTED = 0
+    ERROR = 1
+    PAUSED = 2
+    PRINTING = 3
+    READY = 4
+    STARTUP = 5
+    SHUTDOWN = 6
+
+
+# Printer.state keeps the names used by klipper, these map them to the enum
+PRINTER_STATES = {state.name.lower(): state for state in PrinterState}
+# Indexed by PrinterState
+STATE_NAMES = tuple(state.name.lower() for state in PrinterState)
+
+
 class Printer:
     def __init__(self, state_cb, state_callbacks, busy_cb):
         self.config = {}
         self.data = {}
         self.state = "disconnected"
         self.state_cb = state_cb
-        self.state_callbacks = state_callbacks
+        # Indexed by PrinterState
+        self.state_callbacks = tuple(state_callbacks.get(state) for state in PrinterState)
         self.devices = {}
         self.power_devices = {}
         self.tools = []
@@ -138,14 +156,18 @@ class Printer:
             self.power_devices[data['device']]['status'] = data['status']
 
     def change_state(self, state):
-        if state not in list(self.state_callbacks):
+        if state in PRINTER_STATES:
+            state = PRINTER_STATES[state]
+        elif not isinstance(state, PrinterState):
             return  # disconnected, startup, ready, shutdown, error, paused, printing
-        if state != self.state:
-            logging.debug(f"Changing state from '{self.state}' to '{state}'")
-            self.state = state
-        if self.state_callbacks[state] is not None:
-            logging.debug(f"Adding callback for state: {state}")
-            GLib.idle_add(self.state_cb, self.state_callbacks[state])
+        name = STATE_NAMES[state]
+        if name != self.state:
+            logging.debug(f"Changing state from '{self.state}' to '{name}'")
+            self.state = name
+        callback = self.state_callbacks[state]
+        if callback is not None:
+            logging.debug(f"Adding callback for state: {name}")
+            GLib.idle_add(self.state_cb, callback)
 
     def configure_power_devices(self, data):
         self.power_devices = {}
@@ -155,7 +177,7 @@ class Printer:
             self.power_devices[x['device']] = {
                 "status": "on" if x['status'] == "on" else "off"
             }
-        logging.debug(f"Power devices: {self.power_devices}")
+        logging.debug("Power devices: %s", self.power_devices)
 
     def get_config_section_list(self, search=""):
         if self.config is not None:
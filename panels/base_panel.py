@@ -6,10 +6,10 @@ import gi
 
 gi.require_version("Gtk", "3.0")
 from gi.repository import GLib, Gtk, Pango
-from jinja2 import Environment
 from datetime import datetime
 from math import log
 
+from ks_includes.functions import compile_template
 from ks_includes.screen_panel import ScreenPanel
 
 
@@ -292,10 +292,7 @@ class BasePanel(ScreenPanel):
             self.titlelbl.set_label(f"{self._screen.connecting_to_printer}")
             return
         try:
-            env = Environment(extensions=["jinja2.ext.i18n"], autoescape=True)
-            env.install_gettext_translations(self._config.get_lang())
-            j2_temp = env.from_string(title)
-            title = j2_temp.render()
+            title = compile_template(title).render()
         except Exception as e:
             logging.debug(f"Error parsing jinja for title: {title}\n{e}")
 
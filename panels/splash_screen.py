@@ -106,10 +106,11 @@ class SplashScreenPanel(ScreenPanel):
             devices = self._printer.get_power_devices()
             if devices is not None:
                 for device in devices:
-                    if self._printer.get_power_device_status(device) == "off":
+                    status = self._printer.get_power_device_status(device)
+                    if status == "off":
                         self.labels['power'].set_sensitive(True)
                         break
-                    elif self._printer.get_power_device_status(device) == "on":
+                    elif status == "on":
                         self.labels['power'].set_sensitive(False)
 
     def firmware_restart(self, widget):
@@ -1,20 +1,25 @@
 #!/usr/bin/python
 
 import argparse
+import contextlib
+import functools
+import hashlib
 import json
 import logging
 import os
 import subprocess
+import tempfile
+import threading
 import pathlib
+import requests
 import traceback  # noqa
 import locale
 import sys
 import gi
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, Gdk, GLib, Pango
+from gi.repository import Gtk, Gdk, GdkPixbuf, GLib, Pango
 from importlib import import_module
-from jinja2 import Environment
 from signal import SIGTERM
 
 from ks_includes import functions
@@ -22,7 +27,7 @@ from ks_includes.KlippyWebsocket import KlippyWebsocket
 from ks_includes.KlippyRest import KlippyRest
 from ks_includes.files import KlippyFiles
 from ks_includes.KlippyGtk import KlippyGtk
-from ks_includes.printer import Printer
+from ks_includes.printer import Printer, PrinterState
 from ks_includes.widgets.keyboard import Keyboard
 from ks_includes.config import KlipperScreenConfig
 from panels.base_panel import BasePanel
@@ -48,17 +53,85 @@ PRINTER_BASE_STATUS_OBJECTS = [
     'exclude_object',
 ]
 
+# Fields requested in the websocket subscription, the configured devices are added in ws_subscribe
+STATIC_SUBSCRIPTION_OBJECTS = {
+    "bed_mesh": ("profile_name", "mesh_max", "mesh_min", "probed_matrix", "profiles"),
+    "configfile": ("config",),
+    "display_status": ("progress", "message"),
+    "fan": ("speed",),
+    "gcode_move": ("extrude_factor", "gcode_position", "homing_origin", "speed_factor", "speed"),
+    "idle_timeout": ("state",),
+    "pause_resume": ("is_paused",),
+    "print_stats": ("print_duration", "total_duration", "filament_used", "filename", "state", "message", "info"),
+    "toolhead": ("homed_axes", "estimated_print_time", "print_time", "position", "extruder",
+                 "max_accel", "max_accel_to_decel", "max_velocity", "square_corner_velocity"),
+    "virtual_sdcard": ("file_position", "is_active", "progress"),
+    "webhooks": ("state", "state_message"),
+    "firmware_retraction": ("retract_length", "retract_speed", "unretract_extra_length", "unretract_speed"),
+    "motion_report": ("live_position", "live_velocity", "live_extruder_velocity"),
+    "exclude_object": ("current_object", "objects", "excluded_objects"),
+}
+EXTRUDER_FIELDS = ("target", "temperature", "pressure_advance", "smooth_time", "power")
+HEATER_FIELDS = ("target", "temperature", "power")
+FAN_FIELDS = ("speed",)
+FILAMENT_SENSOR_FIELDS = ("enabled", "filament_detected")
+OUTPUT_PIN_FIELDS = ("value",)
+
+RTL_LANGUAGES = ('he',)
+
+# Gcode responses shown as popups and their level
+POPUP_PREFIXES = (
+    ("echo: ", 1),
+    ("!! ", 3),
+)
+
+POPUP_LEVEL_CLASSES = {
+    1: "message_popup_echo",
+    2: "message_popup_warning",
+    3: "message_popup_error",
+}
+
 klipperscreendir = pathlib.Path(__file__).parent.resolve()
+PANELS_DIR = klipperscreendir / "panels"
+STYLES_DIR = klipperscreendir / "styles"
+ICON_PATH = str(STYLES_DIR / "icon.svg")
+EMPTY_CURSOR_PATH = str(klipperscreendir / "ks_includes" / "emptyCursor.xbm")
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "KlipperScreen")
+
+
+def scan_files(directory):
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name: entry for entry in entries if entry.is_file()}
+    except OSError:
+        return {}
+
+
+def build_panel_index(panels_dir):
+    # Scanned once at startup, the modules are only imported when the panel is shown
+    return {
+        name[:-3]: entry.path
+        for name, entry in scan_files(panels_dir).items()
+        if name.endswith(".py") and not name.startswith("_")
+    }
+
+
+PANEL_INDEX = build_panel_index(PANELS_DIR)
+
+
+@functools.lru_cache(maxsize=8)
+def objects_query(extra_items):
+    # The objects rarely change between retries, reuse the query string
+    return "printer/objects/query?" + "&".join(PRINTER_BASE_STATUS_OBJECTS + list(extra_items))
 
 
 def set_text_direction(lang=None):
-    rtl_languages = ['he']
     if lang is None:
-        for lng in rtl_languages:
-            if locale.getlocale()[0].startswith(lng):
-                lang = lng
-                break
-    if lang in rtl_languages:
+        # getlocale() returns None when the locale is not set
+        system_lang = locale.getlocale()[0] or ""
+        if system_lang.startswith(RTL_LANGUAGES):
+            lang = next(lng for lng in RTL_LANGUAGES if system_lang.startswith(lng))
+    if lang in RTL_LANGUAGES:
         Gtk.Widget.set_default_direction(Gtk.TextDirection.RTL)
         logging.debug("Enabling RTL mode")
         return False
@@ -81,16 +154,22 @@ class KlipperScreen(Gtk.Window):
     load_panel = {}
     panels = {}
     popup_message = None
+    popup_widgets = None
     screensaver = None
+    screensaver_widgets = None
     printers = printer = None
     subscriptions = []
+    subscribed = set()
     updating = False
     _ws = None
     screensaver_timeout = None
+    screensaver_inhibited = False
     reinit_count = 0
     max_retries = 4
-    initialized = initializing = False
+    initialized = False
     popup_timeout = None
+    font_provider = None
+    matchbox = None
 
     def __init__(self, args, version):
         try:
@@ -101,36 +180,68 @@ class KlipperScreen(Gtk.Window):
         self.blanking_time = 600
         self.use_dpms = True
         self.apiclient = None
+        self.http_session = requests.Session()
+        # Used only by the init workers, requests sessions are not thread-safe
+        self.init_session = requests.Session()
+        self.init_apiclient = None
+        self.initializing = threading.Event()
+        # Bumped to discard the results of initializations that no longer apply
+        self.init_generation = 0
+        # Set when an initialization is requested while another one is running
+        self.init_requested = False
+        # Keeps the worker session used by one thread at a time
+        self.init_lock = threading.Lock()
+        usrkbd = os.path.expanduser("~/.matchbox/keyboard.xml")
+        self.mb_kbd_config = usrkbd if os.path.isfile(usrkbd) else "ks_includes/locales/keyboard.xml"
         self.version = version
         self.dialogs = []
         self.confirm = None
+        self._pending_status = {}
+        self._status_flush = None
+        # Updates are held while the initial status query is running, so the snapshot can't overwrite them
+        self.status_snapshot_pending = False
+        # Handlers returning False keep the message from reaching the panels
+        self._ws_handlers = {
+            "notify_klippy_disconnected": self._ws_notify_klippy_disconnected,
+            "notify_klippy_shutdown": self._ws_notify_klippy_shutdown,
+            "notify_klippy_ready": self._ws_notify_klippy_ready,
+            "notify_status_update": self._ws_notify_status_update,
+            "notify_filelist_changed": self._ws_notify_filelist_changed,
+            "notify_metadata_update": self._ws_notify_metadata_update,
+            "notify_update_response": self._ws_notify_update_response,
+            "notify_power_changed": self._ws_notify_power_changed,
+            "notify_gcode_response": self._ws_notify_gcode_response,
+        }
 
         configfile = os.path.normpath(os.path.expanduser(args.configfile))
 
         self._config = KlipperScreenConfig(configfile, self)
-        self.lang_ltr = set_text_direction(self._config.get_main_config().get("language", None))
+        self._main_config = self._config.get_main_config()
+        self.install_template_translations()
+        self.lang_ltr = set_text_direction(self._main_config.get("language", None))
 
         self.connect("key-press-event", self._key_press_event)
         self.connect("configure_event", self.update_size)
+        self.connect("destroy", self.kill_matchbox_keyboard)
         monitor = Gdk.Display.get_default().get_primary_monitor()
         if monitor is None:
             monitor = Gdk.Display.get_default().get_monitor(0)
         if monitor is None:
             raise RuntimeError("Couldn't get default monitor")
-        self.width = self._config.get_main_config().getint("width", monitor.get_geometry().width)
-        self.height = self._config.get_main_config().getint("height", monitor.get_geometry().height)
+        self.width = self._main_config.getint("width", monitor.get_geometry().width)
+        self.height = self._main_config.getint("height", monitor.get_geometry().height)
         self.set_default_size(self.width, self.height)
         self.set_resizable(True)
-        if not (self._config.get_main_config().get("width") or self._config.get_main_config().get("height")):
+        if not (self._main_config.get("width") or self._main_config.get("height")):
             self.fullscreen()
         self.aspect_ratio = self.width / self.height
         self.vertical_mode = self.aspect_ratio < 1.0
         logging.info(f"Screen resolution: {self.width}x{self.height}")
-        self.theme = self._config.get_main_config().get('theme')
-        self.show_cursor = self._config.get_main_config().getboolean("show_cursor", fallback=False)
+        self.theme = self._main_config.get('theme')
+        self.show_cursor = self._main_config.getboolean("show_cursor", fallback=False)
         self.gtk = KlippyGtk(self)
         self.init_style()
-        self.set_icon_from_file(os.path.join(klipperscreendir, "styles", "icon.svg"))
+        self.set_window_icon()
 
         self.base_panel = BasePanel(self, title="Base Panel")
         self.add(self.base_panel.main_grid)
@@ -138,34 +249,44 @@ class KlipperScreen(Gtk.Window):
         if self.show_cursor:
             self.get_window().set_cursor(
                 Gdk.Cursor.new_for_display(Gdk.Display.get_default(), Gdk.CursorType.ARROW))
-            os.system("xsetroot  -cursor_name  arrow")
+            self.run_x11_command("xsetroot", "-cursor_name", "arrow")
         else:
             self.get_window().set_cursor(
                 Gdk.Cursor.new_for_display(Gdk.Display.get_default(), Gdk.CursorType.BLANK_CURSOR))
-            os.system("xsetroot  -cursor ks_includes/emptyCursor.xbm ks_includes/emptyCursor.xbm")
+            self.run_x11_command("xsetroot", "-cursor", EMPTY_CURSOR_PATH, EMPTY_CURSOR_PATH)
         self.base_panel.activate()
         if self._config.errors:
             self.show_error_modal("Invalid config file", self._config.get_errors())
             # Prevent this dialog from being destroyed
             self.dialogs = []
-        self.set_screenblanking_timeout(self._config.get_main_config().get('screen_blanking'))
+        self.set_screenblanking_timeout(self._main_config.get('screen_blanking'))
+
+        # Import the panels that usually follow the splash screen while waiting for moonraker
+        preload = ["main_menu", "menu", "job_status"]
+        if len(self._config.get_printers()) > 1:
+            preload.append("printer_select")
+        GLib.idle_add(self._preload_panels, preload, priority=GLib.PRIORITY_LOW)
 
         self.initial_connection()
 
+    def install_template_translations(self):
+        functions.JINJA_ENV.install_gettext_translations(self._config.get_lang())
+        functions.compile_template.cache_clear()
+
     def initial_connection(self):
         self.printers = self._config.get_printers()
         state_callbacks = {
-            "disconnected": self.state_disconnected,
-            "error": self.state_error,
-            "paused": self.state_printing,
-            "printing": self.state_printing,
-            "ready": self.state_ready,
-            "startup": self.state_startup,
-            "shutdown": self.state_shutdown
+            PrinterState.DISCONNECTED: self.state_disconnected,
+            PrinterState.ERROR: self.state_error,
+            PrinterState.PAUSED: self.state_printing,
+            PrinterState.PRINTING: self.state_printing,
+            PrinterState.READY: self.state_ready,
+            PrinterState.STARTUP: self.state_startup,
+            PrinterState.SHUTDOWN: self.state_shutdown
         }
         for printer in self.printers:
             printer["data"] = Printer(state_execute, state_callbacks, self.process_busy_state)
-        default_printer = self._config.get_main_config().get('default_printer')
+        default_printer = self._main_config.get('default_printer')
         logging.debug(f"Default printer: {default_printer}")
         if [True for p in self.printers if default_printer in p]:
             self.connect_printer(default_printer)
@@ -188,6 +309,11 @@ class KlipperScreen(Gtk.Window):
 
         self.connecting = True
         self.initialized = False
+        self.init_generation += 1
+        self.initializing.clear()
+        self.init_requested = False
+        self.status_snapshot_pending = False
+        self._pending_status = {}
 
         ind = 0
         logging.info(f"Connecting to printer: {name}")
@@ -201,6 +327,13 @@ class KlipperScreen(Gtk.Window):
             self.printers[ind][name]["moonraker_host"],
             self.printers[ind][name]["moonraker_port"],
             self.printers[ind][name]["moonraker_api_key"],
+            self.http_session,
+        )
+        self.init_apiclient = KlippyRest(
+            self.printers[ind][name]["moonraker_host"],
+            self.printers[ind][name]["moonraker_port"],
+            self.printers[ind][name]["moonraker_api_key"],
+            self.init_session,
         )
 
         self.printer_initializing(_("Connecting to %s") % name, remove=True)
@@ -219,54 +352,46 @@ class KlipperScreen(Gtk.Window):
         self._ws.initial_connect()
 
     def ws_subscribe(self):
-        requested_updates = {
-            "objects": {
-                "bed_mesh": ["profile_name", "mesh_max", "mesh_min", "probed_matrix", "profiles"],
-                "configfile": ["config"],
-                "display_status": ["progress", "message"],
-                "fan": ["speed"],
-                "gcode_move": ["extrude_factor", "gcode_position", "homing_origin", "speed_factor", "speed"],
-                "idle_timeout": ["state"],
-                "pause_resume": ["is_paused"],
-                "print_stats": ["print_duration", "total_duration", "filament_used", "filename", "state", "message",
-                                "info"],
-                "toolhead": ["homed_axes", "estimated_print_time", "print_time", "position", "extruder",
-                             "max_accel", "max_accel_to_decel", "max_velocity", "square_corner_velocity"],
-                "virtual_sdcard": ["file_position", "is_active", "progress"],
-                "webhooks": ["state", "state_message"],
-                "firmware_retraction": ["retract_length", "retract_speed", "unretract_extra_length", "unretract_speed"],
-                "motion_report": ["live_position", "live_velocity", "live_extruder_velocity"],
-                "exclude_object": ["current_object", "objects", "excluded_objects"]
-            }
-        }
+        objects = dict(STATIC_SUBSCRIPTION_OBJECTS)
         for extruder in self.printer.get_tools():
-            requested_updates['objects'][extruder] = [
-                "target", "temperature", "pressure_advance", "smooth_time", "power"]
+            objects[extruder] = EXTRUDER_FIELDS
         for h in self.printer.get_heaters():
-            requested_updates['objects'][h] = ["target", "temperature", "power"]
+            objects[h] = HEATER_FIELDS
         for f in self.printer.get_fans():
-            requested_updates['objects'][f] = ["speed"]
+            objects[f] = FAN_FIELDS
         for f in self.printer.get_filament_sensors():
-            requested_updates['objects'][f] = ["enabled", "filament_detected"]
+            objects[f] = FILAMENT_SENSOR_FIELDS
         for p in self.printer.get_output_pins():
-            requested_updates['objects'][p] = ["value"]
+            objects[p] = OUTPUT_PIN_FIELDS
 
-        self._ws.klippy.object_subscription(requested_updates)
+        self._ws.klippy.object_subscription({"objects": objects})
 
-    def _load_panel(self, panel, *args, **kwargs):
-        if panel not in self.load_panel:
-            logging.debug(f"Loading panel: {panel}")
-            panel_path = os.path.join(os.path.dirname(__file__), 'panels', f"{panel}.py")
-            logging.info(f"Panel path: {panel_path}")
-            if not os.path.exists(panel_path):
-                logging.error(f"Panel {panel} does not exist")
-                raise FileNotFoundError(os.strerror(2), "\n" + panel_path)
-
-            module = import_module(f"panels.{panel}")
-            if not hasattr(module, "create_panel"):
-                raise ImportError(f"Cannot locate create_panel function for {panel}")
-            self.load_panel[panel] = getattr(module, "create_panel")
+    def _import_panel(self, panel):
+        if panel in self.load_panel:
+            return
+        logging.debug(f"Loading panel: {panel}")
+        if panel not in PANEL_INDEX:
+            logging.error(f"Panel {panel} does not exist")
+            raise FileNotFoundError(os.strerror(2), "\n" + str(PANELS_DIR / f"{panel}.py"))
+        logging.info(f"Panel path: {PANEL_INDEX[panel]}")
+
+        module = import_module(f"panels.{panel}")
+        if not hasattr(module, "create_panel"):
+            raise ImportError(f"Cannot locate create_panel function for {panel}")
+        self.load_panel[panel] = getattr(module, "create_panel")
+
+    def _preload_panels(self, panels):
+        # One module per call, so input and redraws can run in between
+        if not panels:
+            return False
+        try:
+            self._import_panel(panels.pop(0))
+        except Exception as e:
+            logging.exception(f"Unable to preload panel:\n{e}")
+        return True
 
+    def _load_panel(self, panel, *args, **kwargs):
+        self._import_panel(panel)
         try:
             return self.load_panel[panel](*args, **kwargs)
         except Exception as e:
@@ -303,46 +428,64 @@ class KlipperScreen(Gtk.Window):
             self.process_update("notify_busy", self.printer.busy)
         if hasattr(self.panels[panel_name], "activate"):
             self.panels[panel_name].activate()
-        self.show_all()
+        # Only the attached panel needs to be shown, the rest of the window already is
+        self.panels[panel_name].content.show_all()
 
     def show_popup_message(self, message, level=3):
         self.close_screensaver()
         if self.popup_message is not None:
             self.close_popup_message()
 
-        msg = Gtk.Button(label=f"{message}")
-        msg.set_hexpand(True)
-        msg.set_vexpand(True)
-        msg.get_child().set_line_wrap(True)
-        msg.get_child().set_line_wrap_mode(Pango.WrapMode.WORD_CHAR)
-        msg.get_child().set_max_width_chars(40)
-        msg.connect("clicked", self.close_popup_message)
-        msg.get_style_context().add_class("message_popup")
-        if level == 1:
-            msg.get_style_context().add_class("message_popup_echo")
-        elif level == 2:
-            msg.get_style_context().add_class("message_popup_warning")
-        else:
-            msg.get_style_context().add_class("message_popup_error")
+        if self.popup_widgets is None:
+            self.popup_widgets = self._create_popup()
+        self.popup_widgets['label'].set_label(f"{message}")
+        style = self.popup_widgets['button'].get_style_context()
+        for level_class in POPUP_LEVEL_CLASSES.values():
+            style.remove_class(level_class)
+        style.add_class(POPUP_LEVEL_CLASSES.get(level, "message_popup_error"))
 
-        popup = Gtk.Popover.new(self.base_panel.titlebar)
-        popup.get_style_context().add_class("message_popup_popover")
+        popup = self.popup_widgets['popover']
         popup.set_size_request(self.width * .9, -1)
-        popup.set_halign(Gtk.Align.CENTER)
-        popup.add(msg)
         popup.popup()
 
         self.popup_message = popup
         self.popup_message.show_all()
 
-        if self._config.get_main_config().getboolean('autoclose_popups', True):
-            if self.popup_timeout is not None:
-                GLib.source_remove(self.popup_timeout)
-                self.popup_timeout = None
-            self.popup_timeout = GLib.timeout_add_seconds(10, self.close_popup_message)
+        # A single timer is kept, every new message restarts it
+        if self.popup_timeout is not None:
+            GLib.source_remove(self.popup_timeout)
+            self.popup_timeout = None
+        if self._config.get_main_bool('autoclose_popups', True):
+            self.popup_timeout = GLib.timeout_add_seconds(10, self._popup_timeout_fire)
 
         return False
 
+    def _popup_timeout_fire(self):
+        # Returning False removes the source, it must not be removed again when closing
+        self.popup_timeout = None
+        self.close_popup_message()
+        return False
+
+    def _create_popup(self):
+        # Built once and reused, only the text and the level change between messages
+        label = Gtk.Label()
+        label.set_line_wrap(True)
+        label.set_line_wrap_mode(Pango.WrapMode.WORD_CHAR)
+        label.set_max_width_chars(40)
+
+        msg = Gtk.Button()
+        msg.add(label)
+        msg.set_hexpand(True)
+        msg.set_vexpand(True)
+        msg.connect("clicked", self.close_popup_message)
+        msg.get_style_context().add_class("message_popup")
+
+        popup = Gtk.Popover.new(self.base_panel.titlebar)
+        popup.get_style_context().add_class("message_popup_popover")
+        popup.set_halign(Gtk.Align.CENTER)
+        popup.add(msg)
+        return {"popover": popup, "button": msg, "label": label}
+
     def close_popup_message(self, widget=None):
         if self.popup_message is None:
             return
@@ -393,66 +536,148 @@ class KlipperScreen(Gtk.Window):
 
     def restart_ks(self, *args):
         logging.debug(f"Restarting {sys.executable} {' '.join(sys.argv)}")
+        self.kill_matchbox_keyboard()
         os.execv(sys.executable, ['python'] + sys.argv)
         self._ws.send_method("machine.services.restart", {"service": "KlipperScreen"})  # Fallback
 
+    def set_window_icon(self):
+        icon = self.cached_icon_path()
+        try:
+            self.set_icon_from_file(icon)
+        except GLib.Error as e:
+            logging.error(f"Unable to load icon {icon}:\n{e}")
+            if icon != ICON_PATH:
+                with contextlib.suppress(OSError):
+                    os.remove(icon)
+                self.set_icon_from_file(ICON_PATH)
+
+    def cached_icon_path(self, size=128):
+        # Rasterize the svg once instead of parsing it on every start
+        cached_icon = os.path.join(CACHE_DIR, f"icon-{size}x{size}.png")
+        with contextlib.suppress(OSError):
+            if os.path.getmtime(cached_icon) >= os.path.getmtime(ICON_PATH):
+                return cached_icon
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(ICON_PATH, size, size)
+            success, data = pixbuf.save_to_bufferv("png", [], [])
+        except GLib.Error as e:
+            logging.error(f"Unable to rasterize {ICON_PATH}:\n{e}")
+            return ICON_PATH
+        if not success:
+            return ICON_PATH
+        self.save_cache_file(cached_icon, data, "icon-")
+        return cached_icon if os.path.exists(cached_icon) else ICON_PATH
+
     def init_style(self):
         settings = Gtk.Settings.get_default()
         settings.set_property("gtk-theme-name", "Adwaita")
         settings.set_property("gtk-application-prefer-dark-theme", False)
-        css_data = pathlib.Path(os.path.join(klipperscreendir, "styles", "base.css")).read_text()
-
-        with open(os.path.join(klipperscreendir, "styles", "base.conf")) as f:
+        # One directory listing each instead of probing every file
+        styles = scan_files(STYLES_DIR)
+        theme_files = scan_files(STYLES_DIR / self.theme)
+        base_style = styles["base.css"]
+        base_style_conf = styles["base.conf"]
+        theme_style = theme_files.get("style.css")
+        theme_style_conf = theme_files.get("style.conf")
+
+        with open(base_style_conf.path) as f:
             style_options = json.load(f)
         # Load custom theme
-        theme = os.path.join(klipperscreendir, "styles", self.theme)
-        theme_style = os.path.join(theme, "style.css")
-        theme_style_conf = os.path.join(theme, "style.conf")
-
-        if os.path.exists(theme_style):
-            with open(theme_style) as css:
-                css_data += css.read()
-        if os.path.exists(theme_style_conf):
+        if theme_style_conf is not None:
             try:
-                with open(theme_style_conf) as f:
+                with open(theme_style_conf.path) as f:
                     style_options.update(json.load(f))
             except Exception as e:
                 logging.error(f"Unable to parse custom template conf file:\n{e}")
 
         self.gtk.color_list = style_options['graph_colors']
 
-        for i in range(len(style_options['graph_colors']['extruder']['colors'])):
-            num = "" if i == 0 else i
-            css_data += "\n.graph_label_extruder%s {border-left-color: #%s}" % (
-                num,
-                style_options['graph_colors']['extruder']['colors'][i]
-            )
-        for i in range(len(style_options['graph_colors']['bed']['colors'])):
-            css_data += "\n.graph_label_heater_bed%s {border-left-color: #%s}" % (
-                "" if i == 0 else i + 1,
-                style_options['graph_colors']['bed']['colors'][i]
-            )
-        for i in range(len(style_options['graph_colors']['fan']['colors'])):
-            css_data += "\n.graph_label_fan_%s {border-left-color: #%s}" % (
-                i + 1,
-                style_options['graph_colors']['fan']['colors'][i]
-            )
-        for i in range(len(style_options['graph_colors']['sensor']['colors'])):
-            css_data += "\n.graph_label_sensor_%s {border-left-color: #%s}" % (
-                i + 1,
-                style_options['graph_colors']['sensor']['colors'][i]
-            )
-
-        css_data = css_data.replace("KS_FONT_SIZE", f"{self.gtk.font_size}")
-
+        sources = [base_style, base_style_conf, theme_style, theme_style_conf]
+        cache_key = "|".join(
+            # The mtime of this file covers changes to build_css
+            [self.theme, f"{os.path.getmtime(__file__)}"]
+            + [f"{src.stat().st_mtime}" if src is not None else "" for src in sources]
+        )
+        cached_style = os.path.join(CACHE_DIR, f"style-{hashlib.sha1(cache_key.encode()).hexdigest()}.css")
+        # Cached with the placeholder custom themes may use, so the font size doesn't invalidate it
+        font_size = f"{self.gtk.font_size}".encode()
         style_provider = Gtk.CssProvider()
-        style_provider.load_from_data(css_data.encode())
+        try:
+            style_provider.load_from_data(pathlib.Path(cached_style).read_bytes().replace(b"KS_FONT_SIZE", font_size))
+            logging.debug(f"Using cached style {cached_style}")
+        except (OSError, GLib.Error) as e:
+            if isinstance(e, GLib.Error):
+                logging.error(f"Invalid cached style {cached_style}, rebuilding it:\n{e}")
+                with contextlib.suppress(OSError):
+                    os.remove(cached_style)
+            css_data = self.build_css(base_style.path, theme_style.path if theme_style else None,
+                                      style_options['graph_colors'])
+            style_provider = Gtk.CssProvider()
+            style_provider.load_from_data(css_data.replace(b"KS_FONT_SIZE", font_size))
+            self.save_cache_file(cached_style, css_data, "style-")
 
         Gtk.StyleContext.add_provider_for_screen(
             Gdk.Screen.get_default(),
             style_provider,
             Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
         )
+        self.load_font_size_css()
+
+    def load_font_size_css(self):
+        # Kept in its own small provider so the themed CSS doesn't depend on the font size
+        if self.font_provider is None:
+            self.font_provider = Gtk.CssProvider()
+            # Below the theme provider, so the sizes set by the theme still take precedence
+            Gtk.StyleContext.add_provider_for_screen(
+                Gdk.Screen.get_default(),
+                self.font_provider,
+                Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION - 1
+            )
+        self.font_provider.load_from_data(f"* {{font-size: {self.gtk.font_size}px;}}".encode())
+
+    @staticmethod
+    def build_css(base_style, theme_style, graph_colors):
+        css_parts = [pathlib.Path(base_style).read_text()]
+        if theme_style is not None:
+            css_parts.append(pathlib.Path(theme_style).read_text())
+        css_parts.extend(
+            f"\n.graph_label_extruder{'' if i == 0 else i} {{border-left-color: #{color}}}"
+            for i, color in enumerate(graph_colors['extruder']['colors'])
+        )
+        css_parts.extend(
+            f"\n.graph_label_heater_bed{'' if i == 0 else i + 1} {{border-left-color: #{color}}}"
+            for i, color in enumerate(graph_colors['bed']['colors'])
+        )
+        css_parts.extend(
+            f"\n.graph_label_fan_{i + 1} {{border-left-color: #{color}}}"
+            for i, color in enumerate(graph_colors['fan']['colors'])
+        )
+        css_parts.extend(
+            f"\n.graph_label_sensor_{i + 1} {{border-left-color: #{color}}}"
+            for i, color in enumerate(graph_colors['sensor']['colors'])
+        )
+        return "".join(css_parts).encode()
+
+    @staticmethod
+    def save_cache_file(path, data, prefix):
+        tmp = None
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # Written aside and moved into place, a partial write never looks like a valid cache
+            with tempfile.NamedTemporaryFile(dir=CACHE_DIR, prefix=".tmp-", delete=False) as f:
+                tmp = f.name
+                f.write(data)
+            # Keep only the latest file of each kind
+            with os.scandir(CACHE_DIR) as entries:
+                for entry in entries:
+                    if entry.name.startswith(prefix):
+                        os.remove(entry.path)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.error(f"Unable to write cache file {path}:\n{e}")
+            if tmp is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp)
 
     def _go_to_submenu(self, widget, name):
         logging.info(f"#### Go to submenu {name}")
@@ -473,10 +698,15 @@ class KlipperScreen(Gtk.Window):
             logging.info("No items in menu")
 
     def _remove_all_panels(self):
+        self.remove_keyboard()
         self.subscriptions = []
+        self.subscribed = set()
         self._cur_panels = []
+        # Only detached, the instances stay in self.panels and show_panel reattaches them
         for _ in self.base_panel.content.get_children():
-            self.base_panel.content.remove(_)
+            # Unparenting the matchbox socket would drop the embedded keyboard
+            if self.matchbox is None or _ is not self.matchbox['box']:
+                self.base_panel.content.remove(_)
         for dialog in self.dialogs:
             self.gtk.remove_dialog(dialog)
         self.close_screensaver()
@@ -488,7 +718,8 @@ class KlipperScreen(Gtk.Window):
         self.base_panel.remove(self.panels[self._cur_panels[-1]].content)
         if hasattr(self.panels[self._cur_panels[-1]], "deactivate"):
             self.panels[self._cur_panels[-1]].deactivate()
-        if self._cur_panels[-1] in self.subscriptions:
+        if self._cur_panels[-1] in self.subscribed:
+            self.subscribed.remove(self._cur_panels[-1])
             self.subscriptions.remove(self._cur_panels[-1])
         if pop:
             del self._cur_panels[-1]
@@ -497,7 +728,7 @@ class KlipperScreen(Gtk.Window):
     def _menu_go_back(self, widget=None, home=False):
         logging.info(f"#### Menu go {'home' if home else 'back'}")
         self.remove_keyboard()
-        if self._config.get_main_config().getboolean('autoclose_popups', True):
+        if self._config.get_main_bool('autoclose_popups', True):
             self.close_popup_message()
         while len(self._cur_panels) > 1:
             self._remove_current_panel()
@@ -505,10 +736,15 @@ class KlipperScreen(Gtk.Window):
                 break
 
     def add_subscription(self, panel_name):
-        if panel_name not in self.subscriptions:
+        # The set answers membership, the list keeps the order for dispatching updates
+        if panel_name not in self.subscribed:
+            self.subscribed.add(panel_name)
             self.subscriptions.append(panel_name)
 
     def reset_screensaver_timeout(self, *args):
+        # Called on every button press, nothing to do when blanking is off or handled by DPMS
+        if self.screensaver_inhibited:
+            return
         if self.screensaver_timeout is not None:
             GLib.source_remove(self.screensaver_timeout)
             self.screensaver_timeout = None
@@ -524,22 +760,25 @@ class KlipperScreen(Gtk.Window):
             logging.debug("Hiding dialog")
             dialog.hide()
 
-        close = Gtk.Button()
-        close.connect("clicked", self.close_screensaver)
+        if self.screensaver_widgets is None:
+            close = Gtk.Button()
+            close.connect("clicked", self.close_screensaver)
 
-        box = Gtk.Box()
+            box = Gtk.Box()
+            box.pack_start(close, True, True, 0)
+            box.set_halign(Gtk.Align.CENTER)
+            box.get_style_context().add_class("screensaver")
+            self.screensaver_widgets = {"box": box, "close": close}
+        box = self.screensaver_widgets['box']
         box.set_size_request(self.width, self.height)
-        box.pack_start(close, True, True, 0)
-        box.set_halign(Gtk.Align.CENTER)
-        box.get_style_context().add_class("screensaver")
         self.remove(self.base_panel.main_grid)
         self.add(box)
 
         # Avoid leaving a cursor-handle
-        close.grab_focus()
+        self.screensaver_widgets['close'].grab_focus()
         self.screensaver = box
         self.screensaver.show_all()
-        self.power_devices(None, self._config.get_main_config().get("screen_off_devices", ""), on=False)
+        self.power_devices(None, self._main_config.get("screen_off_devices", ""), on=False)
         if self.screensaver_timeout is not None:
             GLib.source_remove(self.screensaver_timeout)
             self.screensaver_timeout = None
@@ -558,8 +797,8 @@ class KlipperScreen(Gtk.Window):
         for dialog in self.dialogs:
             logging.info(f"Restoring Dialog {dialog}")
             dialog.show()
-        self.show_all()
-        self.power_devices(None, self._config.get_main_config().get("screen_on_devices", ""), on=True)
+        self.base_panel.main_grid.show_all()
+        self.power_devices(None, self._main_config.get("screen_on_devices", ""), on=True)
 
     def check_dpms_state(self):
         if not self.use_dpms:
@@ -576,45 +815,59 @@ class KlipperScreen(Gtk.Window):
 
     def wake_screen(self):
         # Wake the screen (it will go to standby as configured)
-        if self._config.get_main_config().get('screen_blanking') != "off":
+        if self._main_config.get('screen_blanking') != "off":
             logging.debug("Screen wake up")
-            os.system("xset -display :0 dpms force on")
+            self.xset("dpms", "force", "on")
+
+    @staticmethod
+    def run_x11_command(*cmd):
+        # Exec directly instead of going through a shell like os.system does
+        try:
+            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            logging.error(f"Unable to run {cmd[0]}: {e}")
+
+    def xset(self, *args):
+        # xset applies all the settings given in a single call
+        self.run_x11_command("xset", "-display", ":0", *args)
 
     def set_dpms(self, use_dpms):
         self.use_dpms = use_dpms
         logging.info(f"DPMS set to: {self.use_dpms}")
-        self.set_screenblanking_timeout(self._config.get_main_config().get('screen_blanking'))
+        self.set_screenblanking_timeout(self._main_config.get('screen_blanking'))
 
     def set_screenblanking_timeout(self, time):
-        os.system("xset -display :0 s blank")
-        os.system("xset -display :0 s off")
-        self.use_dpms = self._config.get_main_config().getboolean("use_dpms", fallback=True)
+        screensaver_off = ["s", "blank", "s", "off"]
+        self.use_dpms = self._main_config.getboolean("use_dpms", fallback=True)
+        if self.screensaver_timeout is not None:
+            GLib.source_remove(self.screensaver_timeout)
+            self.screensaver_timeout = None
+        self.screensaver_inhibited = True
 
         if time == "off":
             logging.debug(f"Screen blanking: {time}")
-            if self.screensaver_timeout is not None:
-                GLib.source_remove(self.screensaver_timeout)
-                self.screensaver_timeout = None
-            os.system("xset -display :0 dpms 0 0 0")
+            self.xset(*screensaver_off, "dpms", "0", "0", "0")
             return
 
         self.blanking_time = abs(int(time))
         logging.debug(f"Changing screen blanking to: {self.blanking_time}")
         if self.use_dpms and functions.dpms_loaded is True:
-            os.system("xset -display :0 +dpms")
+            # DPMS needs to be enabled before its state can be queried
+            self.xset(*screensaver_off, "+dpms")
+            screensaver_off = []
             if functions.get_DPMS_state() == functions.DPMS_State.Fail:
                 logging.info("DPMS State FAIL")
                 self.show_popup_message("DPMS has failed to load")
                 self._config.set("main", "use_dpms", "False")
             else:
                 logging.debug("Using DPMS")
-                os.system("xset -display :0 s off")
-                os.system(f"xset -display :0 dpms 0 {self.blanking_time} 0")
+                self.xset("dpms", "0", f"{self.blanking_time}", "0")
                 GLib.timeout_add_seconds(1, self.check_dpms_state)
                 return
         # Without dpms just blank the screen
         logging.debug("Not using DPMS")
-        os.system("xset -display :0 dpms 0 0 0")
+        self.xset(*screensaver_off, "dpms", "0", "0", "0")
+        self.screensaver_inhibited = self.use_dpms
         self.reset_screensaver_timeout()
         return
 
@@ -680,6 +933,7 @@ class KlipperScreen(Gtk.Window):
 
     def change_language(self, widget, lang):
         self._config.install_language(lang)
+        self.install_template_translations()
         self.lang_ltr = set_text_direction(lang)
         self._config._create_configurable_options(self)
         self.reload_panels()
@@ -695,49 +949,86 @@ class KlipperScreen(Gtk.Window):
     def _websocket_callback(self, action, data):
         if self.connecting:
             return
-        if action == "notify_klippy_disconnected":
-            self.printer.process_update({'webhooks': {'state': "disconnected"}})
+        if self._status_flush is not None and action != "notify_status_update":
+            # Apply the pending status first to keep the order of the messages
+            GLib.source_remove(self._status_flush)
+            self._flush_status_update()
+        handler = self._ws_handlers.get(action)
+        if handler is not None and handler(data) is False:
             return
-        elif action == "notify_klippy_shutdown":
-            self.printer.process_update({'webhooks': {'state': "shutdown"}})
-        elif action == "notify_klippy_ready":
-            self.printer.process_update({'webhooks': {'state': "ready"}})
-        elif action == "notify_status_update" and self.printer.state != "shutdown":
-            self.printer.process_update(data)
-        elif action == "notify_filelist_changed":
-            if self.files is not None:
-                self.files.process_update(data)
-        elif action == "notify_metadata_update":
-            self.files.request_metadata(data['filename'])
-        elif action == "notify_update_response":
-            if 'message' in data and 'Error' in data['message']:
-                logging.error(f"{action}:{data['message']}")
-                self.show_popup_message(data['message'], 3)
-                if "KlipperScreen" in data['message']:
-                    self.restart_ks()
-        elif action == "notify_power_changed":
-            logging.debug("Power status changed: %s", data)
-            self.printer.process_power_update(data)
-            self.panels['splash_screen'].check_power_status()
-        elif action == "notify_gcode_response" and self.printer.state not in ["error", "shutdown"]:
-            if not (data.startswith("B:") or data.startswith("T:")):
-                if data.startswith("echo: "):
-                    self.show_popup_message(data[6:], 1)
-                elif data.startswith("!! "):
-                    self.show_popup_message(data[3:], 3)
-                elif "unknown" in data.lower() and \
-                        not ("TESTZ" in data or "MEASURE_AXES_NOISE" in data or "ACCELEROMETER_QUERY" in data):
-                    self.show_popup_message(data)
-                elif "SAVE_CONFIG" in data and self.printer.state == "ready":
-                    script = {"script": "SAVE_CONFIG"}
-                    self._confirm_send_action(
-                        None,
-                        _("Save configuration?") + "\n\n" + _("Klipper will reboot"),
-                        "printer.gcode.script",
-                        script
-                    )
         self.process_update(action, data)
 
+    def _ws_notify_klippy_disconnected(self, data):
+        self.printer.process_update({'webhooks': {'state': "disconnected"}})
+        return False
+
+    def _ws_notify_klippy_shutdown(self, data):
+        self.printer.process_update({'webhooks': {'state': "shutdown"}})
+
+    def _ws_notify_klippy_ready(self, data):
+        self.printer.process_update({'webhooks': {'state': "ready"}})
+
+    def _ws_notify_status_update(self, data):
+        # Bursts of updates are merged and applied once when the main loop is idle
+        for obj in data:
+            self._pending_status.setdefault(obj, {}).update(data[obj])
+        if self._status_flush is None:
+            self._status_flush = GLib.idle_add(self._flush_status_update, priority=GLib.PRIORITY_DEFAULT_IDLE)
+        return False
+
+    def _flush_status_update(self):
+        self._status_flush = None
+        if self.status_snapshot_pending:
+            return False
+        data, self._pending_status = self._pending_status, {}
+        if not data or self.connecting:
+            return False
+        if self.printer.state != "shutdown":
+            self.printer.process_update(data)
+        self.process_update("notify_status_update", data)
+        return False
+
+    def _ws_notify_filelist_changed(self, data):
+        if self.files is not None:
+            self.files.process_update(data)
+
+    def _ws_notify_metadata_update(self, data):
+        self.files.request_metadata(data['filename'])
+
+    def _ws_notify_update_response(self, data):
+        if 'message' in data and 'Error' in data['message']:
+            logging.error(f"notify_update_response:{data['message']}")
+            self.show_popup_message(data['message'], 3)
+            if "KlipperScreen" in data['message']:
+                self.restart_ks()
+
+    def _ws_notify_power_changed(self, data):
+        logging.debug("Power status changed: %s", data)
+        self.printer.process_power_update(data)
+        self.panels['splash_screen'].check_power_status()
+
+    def _ws_notify_gcode_response(self, data):
+        if self.printer.state in ["error", "shutdown"]:
+            return
+        if data.startswith(("B:", "T:")):
+            # Temperature reports
+            return
+        for prefix, level in POPUP_PREFIXES:
+            if data.startswith(prefix):
+                self.show_popup_message(data[len(prefix):], level)
+                return
+        if "unknown" in data.lower() and \
+                not ("TESTZ" in data or "MEASURE_AXES_NOISE" in data or "ACCELEROMETER_QUERY" in data):
+            self.show_popup_message(data)
+        elif "SAVE_CONFIG" in data and self.printer.state == "ready":
+            script = {"script": "SAVE_CONFIG"}
+            self._confirm_send_action(
+                None,
+                _("Save configuration?") + "\n\n" + _("Klipper will reboot"),
+                "printer.gcode.script",
+                script
+            )
+
     def process_update(self, *args):
         GLib.idle_add(self.base_panel.process_update, *args)
         for x in self.subscriptions:
@@ -750,12 +1041,9 @@ class KlipperScreen(Gtk.Window):
         ]
 
         try:
-            env = Environment(extensions=["jinja2.ext.i18n"], autoescape=True)
-            env.install_gettext_translations(self._config.get_lang())
-            j2_temp = env.from_string(text)
-            text = j2_temp.render()
+            text = functions.compile_template(text).render()
         except Exception as e:
-            logging.debug(f"Error parsing jinja for confirm_send_action\n{e}")
+            logging.debug("Error parsing jinja for confirm_send_action\n%s", e)
 
         label = Gtk.Label()
         label.set_markup(text)
@@ -791,8 +1079,9 @@ class KlipperScreen(Gtk.Window):
         found_devices = []
         if self.connected_printer is None or not devices:
             return found_devices
-        devices = [str(i.strip()) for i in devices.split(',')]
-        power_devices = self.printer.get_power_devices()
+        # dict.fromkeys drops duplicates keeping the configured order
+        devices = dict.fromkeys(i.strip() for i in devices.split(','))
+        power_devices = self.printer.power_devices
         if power_devices:
             found_devices = [dev for dev in devices if dev in power_devices]
             logging.info(f"Found {found_devices}", )
@@ -808,22 +1097,92 @@ class KlipperScreen(Gtk.Window):
 
     def _init_printer(self, msg, remove=False):
         self.printer_initializing(msg, remove)
-        self.initializing = False
         GLib.timeout_add_seconds(3, self.init_printer)
         return False
 
+    def _retry_init_printer(self, msg):
+        # Only the running initialization clears the flag, so runs never overlap
+        self.initializing.clear()
+        self.status_snapshot_pending = False
+        self._pending_status = {}
+        # The retry scheduled by _init_printer covers any request made meanwhile
+        self.init_requested = False
+        return self._init_printer(msg)
+
+    def _init_printer_done(self):
+        self.initializing.clear()
+        if self.init_requested:
+            self.init_requested = False
+            GLib.idle_add(self.init_printer)
+
     def init_printer(self):
-        if self.initializing:
+        if self.initializing.is_set():
+            # Run again once the current initialization is done, e.g. klipper disconnected meanwhile
+            self.init_requested = True
             return False
-        self.initializing = True
         if self.reinit_count > self.max_retries or 'printer_select' in self._cur_panels:
-            self.initializing = False
             return False
-        state = self.apiclient.get_server_info()
+        self.initializing.set()
+        self.init_generation += 1
+        self._init_printer_thread(self._init_printer_io, self._init_printer_apply)
+        return False
+
+    def _init_printer_thread(self, io, apply, *args, retry=True):
+        # Requests run in a thread to keep the ui responsive, the results are applied in the main loop
+        threading.Thread(target=self._init_printer_worker,
+                         args=(self.init_generation, self.init_apiclient, io, apply, args, retry), daemon=True).start()
+
+    def _init_printer_worker(self, generation, apiclient, io, apply, args, retry):
+        result = None
+        try:
+            with self.init_lock:
+                result = io(apiclient, *args)
+        except Exception as e:
+            logging.exception(f"Error requesting the printer data: {e}")
+        # Always reported back, so a failure can't leave the initialization running forever
+        GLib.idle_add(self._init_printer_result, generation, apply, result, retry)
+
+    def _init_printer_result(self, generation, apply, result, retry):
+        if generation != self.init_generation:
+            logging.info("Discarding the results of a previous initialization")
+            return False
+        try:
+            if result is None:
+                raise RuntimeError("No data received")
+            apply(*result)
+        except Exception as e:
+            logging.exception(f"Error initializing the printer: {e}")
+            if retry:
+                self._retry_init_printer("Error initializing the printer")
+        return False
+
+    @staticmethod
+    def _init_printer_io(apiclient):
+        state = apiclient.get_server_info()
+        if state is False:
+            return state, None
+        klippy_connected = state['result']['klippy_connected'] is not False
+        calls = [("machine.device_power.devices", None)]
+        if klippy_connected:
+            calls += [("printer.info", None), ("printer.objects.query", {"objects": {"configfile": None}})]
+        responses = apiclient.send_batch(calls)
+        if responses is False:
+            # Batch not available, fallback to one request per call
+            responses = [apiclient.send_request("machine/device_power/devices")]
+            if klippy_connected:
+                responses += [apiclient.get_printer_info(),
+                              apiclient.send_request("printer/objects/query?configfile")]
+        return state, responses
+
+    @staticmethod
+    def _init_printer_status_io(apiclient, query):
+        return (apiclient.send_request(query),)
+
+    def _init_printer_apply(self, state, responses):
         if state is False:
             logging.info("Moonraker not connected")
-            self.initializing = False
-            return False
+            self._init_printer_done()
+            return
         self.connecting = not self._ws.connected
         self.connected_printer = self.connecting_to_printer
         self.base_panel.set_ks_printer_cfg(self.connected_printer)
@@ -831,7 +1190,7 @@ class KlipperScreen(Gtk.Window):
         # Moonraker is ready, set a loop to init the printer
         self.reinit_count += 1
 
-        powerdevs = self.apiclient.send_request("machine/device_power/devices")
+        powerdevs = responses[0]
         if powerdevs is not False:
             self.printer.configure_power_devices(powerdevs['result'])
 
@@ -841,29 +1200,35 @@ class KlipperScreen(Gtk.Window):
             msg += f"Klipper: {state['result']['klippy_state']}" + "\n\n"
             if self.reinit_count <= self.max_retries:
                 msg += _("Retrying") + f' #{self.reinit_count}'
-            return self._init_printer(msg)
-        printer_info = self.apiclient.get_printer_info()
+            return self._retry_init_printer(msg)
+        printer_info, config = responses[1:]
         if printer_info is False:
-            return self._init_printer("Unable to get printer info from moonraker")
-        config = self.apiclient.send_request("printer/objects/query?configfile")
+            return self._retry_init_printer("Unable to get printer info from moonraker")
         if config is False:
-            return self._init_printer("Error getting printer configuration")
+            return self._retry_init_printer("Error getting printer configuration")
         # Reinitialize printer, in case the printer was shut down and anything has changed.
         self.printer.reinit(printer_info['result'], config['result']['status'])
 
+        self.status_snapshot_pending = True
+        self._pending_status = {}
         self.ws_subscribe()
-        extra_items = (self.printer.get_tools()
-                       + self.printer.get_heaters()
-                       + self.printer.get_fans()
-                       + self.printer.get_filament_sensors()
-                       + self.printer.get_output_pins()
-                       )
-
-        data = self.apiclient.send_request("printer/objects/query?" + "&".join(PRINTER_BASE_STATUS_OBJECTS +
-                                                                               extra_items))
+        extra_items = tuple(self.printer.get_tools()
+                            + self.printer.get_heaters()
+                            + self.printer.get_fans()
+                            + self.printer.get_filament_sensors()
+                            + self.printer.get_output_pins()
+                            )
+        self._init_printer_thread(self._init_printer_status_io, self._init_printer_finish, objects_query(extra_items))
+
+    def _init_printer_finish(self, data):
         if data is False:
-            return self._init_printer("Error getting printer object data with extra items")
+            return self._retry_init_printer("Error getting printer object data with extra items")
         self.printer.process_update(data['result']['status'])
+        # Apply what arrived during the query on top of the snapshot
+        self.status_snapshot_pending = False
+        if self._status_flush is not None:
+            GLib.source_remove(self._status_flush)
+        self._flush_status_update()
         self.init_tempstore()
         GLib.timeout_add_seconds(2, self.init_tempstore)  # If devices changed it takes a while to register
 
@@ -873,12 +1238,22 @@ class KlipperScreen(Gtk.Window):
         logging.info("Printer initialized")
         self.initialized = True
         self.reinit_count = 0
-        self.initializing = False
-        return False
+        self._init_printer_done()
 
     def init_tempstore(self):
-        self.printer.init_temp_store(self.apiclient.send_request("server/temperature_store"))
-        server_config = self.apiclient.send_request("server/config")
+        self._init_printer_thread(self._init_tempstore_io, self._init_tempstore_apply, retry=False)
+        return False
+
+    @staticmethod
+    def _init_tempstore_io(apiclient):
+        responses = apiclient.send_batch([("server.temperature_store", None), ("server.config", None)])
+        if responses is False:
+            responses = [apiclient.send_request("server/temperature_store"),
+                         apiclient.send_request("server/config")]
+        return responses
+
+    def _init_tempstore_apply(self, tempstore, server_config):
+        self.printer.init_temp_store(tempstore)
         if server_config:
             try:
                 self.printer.tempstore_size = server_config["result"]["config"]["data_store"]["temperature_store_size"]
@@ -887,7 +1262,7 @@ class KlipperScreen(Gtk.Window):
                 logging.error("Couldn't get the temperature store size")
 
     def base_panel_show_all(self):
-        self.base_panel.show_macro_shortcut(self._config.get_main_config().getboolean('side_macro_shortcut', True))
+        self.base_panel.show_macro_shortcut(self._config.get_main_bool('side_macro_shortcut', True))
         self.base_panel.show_heaters(True)
         self.base_panel.show_estop(True)
 
@@ -895,61 +1270,88 @@ class KlipperScreen(Gtk.Window):
         if self.keyboard is not None:
             return
 
-        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-        box.set_size_request(self.gtk.content_width, self.gtk.keyboard_height)
-
-        if self._config.get_main_config().getboolean("use-matchbox-keyboard", False):
-            return self._show_matchbox_keyboard(box)
+        if self._config.get_main_bool("use-matchbox-keyboard", False):
+            return self._show_matchbox_keyboard()
         if entry is None:
             logging.debug("Error: no entry provided for keyboard")
             return
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        box.set_size_request(self.gtk.content_width, self.gtk.keyboard_height)
         box.get_style_context().add_class("keyboard_box")
         box.add(Keyboard(self, self.remove_keyboard, entry=entry))
         self.keyboard = {"box": box}
         self.base_panel.content.pack_end(box, False, False, 0)
         self.base_panel.content.show_all()
 
-    def _show_matchbox_keyboard(self, box):
+    def _show_matchbox_keyboard(self):
+        # The process is kept running and its box is only hidden, spawning it is slow
+        if (self.matchbox is None or self.matchbox['process'].poll() is not None
+                or self.matchbox['socket'].get_plug_window() is None):
+            self._create_matchbox_keyboard()
+        self.matchbox['box'].set_size_request(self.gtk.content_width, self.gtk.keyboard_height)
+        self.matchbox['box'].show()
+        self.keyboard = self.matchbox
+
+    def _create_matchbox_keyboard(self):
+        if self.matchbox is not None:
+            self.kill_matchbox_keyboard()
         env = os.environ.copy()
-        usrkbd = os.path.expanduser("~/.matchbox/keyboard.xml")
-        if os.path.isfile(usrkbd):
-            env["MB_KBD_CONFIG"] = usrkbd
-        else:
-            env["MB_KBD_CONFIG"] = "ks_includes/locales/keyboard.xml"
+        env["MB_KBD_CONFIG"] = self.mb_kbd_config
         p = subprocess.Popen(["matchbox-keyboard", "--xid"], stdout=subprocess.PIPE,
                              stderr=subprocess.PIPE, env=env)
         xid = int(p.stdout.readline())
-        logging.debug(f"XID {xid}")
-        logging.debug(f"PID {p.pid}")
+        logging.debug("XID %s", xid)
+        logging.debug("PID %s", p.pid)
 
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        # Keep show_all() of the parents from showing it while hidden
+        box.set_no_show_all(True)
         keyboard = Gtk.Socket()
+        # Unrealizing the socket (e.g. the screensaver) drops the plug, don't leave it floating
+        keyboard.connect("unrealize", self._matchbox_unrealized)
         box.get_style_context().add_class("keyboard_matchbox")
         box.pack_start(keyboard, True, True, 0)
         self.base_panel.content.pack_end(box, False, False, 0)
 
-        self.show_all()
+        keyboard.show()
+        box.show()
         keyboard.add_id(xid)
 
-        self.keyboard = {
+        self.matchbox = {
             "box": box,
             "process": p,
             "socket": keyboard
         }
-        return
+
+    def _matchbox_unrealized(self, widget):
+        if self.matchbox is not None and self.matchbox['process'].poll() is None:
+            os.kill(self.matchbox['process'].pid, SIGTERM)
+
+    def kill_matchbox_keyboard(self, *args):
+        if self.matchbox is None:
+            return
+        if self.matchbox['process'].poll() is None:
+            os.kill(self.matchbox['process'].pid, SIGTERM)
+        parent = self.matchbox['box'].get_parent()
+        if parent is not None:
+            parent.remove(self.matchbox['box'])
+        if self.keyboard is self.matchbox:
+            self.keyboard = None
+        self.matchbox = None
 
     def remove_keyboard(self, widget=None, event=None):
         if self.keyboard is None:
             return
-        if 'process' in self.keyboard:
-            os.kill(self.keyboard['process'].pid, SIGTERM)
-        self.base_panel.content.remove(self.keyboard['box'])
+        if self.keyboard is self.matchbox:
+            self.matchbox['box'].hide()
+        else:
+            self.base_panel.content.remove(self.keyboard['box'])
         self.keyboard = None
 
     def _key_press_event(self, widget, event):
-        keyval_name = Gdk.keyval_name(event.keyval)
-        if keyval_name == "Escape":
+        if event.keyval == Gdk.KEY_Escape:
             self._menu_go_back(home=True)
-        elif keyval_name == "BackSpace" and len(self._cur_panels) > 1 and self.keyboard is None:
+        elif event.keyval == Gdk.KEY_BackSpace and len(self._cur_panels) > 1 and self.keyboard is None:
             self.base_panel.back()
 
     def update_size(self, *args):